@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
+import asyncio
+import importlib.util
+import itertools
+import random
 import time
 import sys
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from operator import itemgetter
+
+import httpx
+import orjson
+
+# Requires httpx and orjson; install httpx's http2 extra (the h2 package) to
+# multiplex requests over HTTP/2, otherwise HTTP/1.1 keep-alive is used:
+#   pip install "httpx[http2]" orjson
 
 # Assuming vast.py is in the parent directory and can be imported
 # In a real scenario, you might install the vastai package via pip
 try:
-    from vast import VastClient, apiurl, apiheaders, http_get, http_put, parse_query, display_table, offers_fields, offers_alias, offers_mult, translate_null_strings_to_blanks
+    from vast import VastClient, apiurl, apiheaders, parse_query, display_table, offers_fields, offers_alias, offers_mult, translate_null_strings_to_blanks
 except ImportError:
     # Fallback for running directly from the vast-node directory
     sys.path.append('../')
-    from vast import VastClient, apiurl, apiheaders, http_get, http_put, parse_query, display_table, offers_fields, offers_alias, offers_mult, translate_null_strings_to_blanks
+    from vast import VastClient, apiurl, apiheaders, parse_query, display_table, offers_fields, offers_alias, offers_mult, translate_null_strings_to_blanks
 
 # API key for testing
 API_KEY = '43866bfbb34e8c810d58987bad96ea6bde3e5d0f29def48337462b4e4d4d94c3'
@@ -26,7 +39,14 @@ config = {
         "order": 'dph_total+',     # Sort by price, cheapest first
         "reliability": 0.95,         # Min 95% reliability
         "direct_port_count": 1,        # Needs at least 1 direct port
-        "external": "false"            # Not an external machine (API expects string "false")
+        "external": "false",           # Not an external machine (API expects string "false")
+        "limit": 20                    # Only the cheapest few offers are considered, so don't fetch the rest
+    },
+
+    # Checks applied to the (price-sorted) offers; the first one passing is rented
+    "offer_selection": {
+        "max_dph_total": 1.00,        # Budget in $/hr
+        "min_reliability": 0.95       # Min reliability2 score
     },
 
     # Instance configuration (using snake_case for Python client)
@@ -62,23 +82,146 @@ class MockArgs:
         self.user = None # Used by create__instance
         self.args = None # Used by create__instance
         self.bid_price = None # Used by create__instance
+        self.label = None # Used by create__instance
+        self.extra = None # Used by create__instance
+
+        # Add attributes from instance_config to MockArgs for create__instance
+        for k, v in config["instance_config"].items():
+            setattr(self, k, v)
+
+
+# Sleep function for waiting periods; yields to the event loop instead of blocking it
+async def asleep(ms):
+    await asyncio.sleep(ms / 1000.0)
+
+# Offer searches are reused for this many seconds (and up to this many distinct
+# searches are kept), so a retry loop doesn't hit /bundles again while the
+# marketplace has barely changed. Any attempt to rent an offer drops the cached
+# searches, since they would still list it (whether we took it or found it gone).
+SEARCH_CACHE_TTL = 5
+SEARCH_CACHE_SIZE = 64
+
+# Upper bound on requests in flight at once when polling several instances
+MAX_CONCURRENT_REQUESTS = 10
+
+# Waits between status polls: probe quickly right after creation (cached images
+# often come up within seconds), then ramp up to POLL_MAX_DELAY
+POLL_DELAYS = (0.5, 1, 2, 4, 8)
+POLL_MAX_DELAY = 15
+
+# Responses worth retrying (throttling and transient gateway errors), and the
+# longest we're willing to wait before a retry however long the API asks for
+RETRY_STATUSES = (429, 502, 503, 504)
+MAX_RETRY_WAIT = 60
+
+# Renting isn't idempotent: a gateway error may arrive after the API already
+# accepted the rental, so creates are only retried when they were throttled
+CREATE_RETRY_STATUSES = (429,)
+
+# Fields read from the selected offer: the API always sends an id, and
+# select_offer only accepts offers with a price
+get_offer_fields = itemgetter("id", "dph_total")
+
+# Statuses after which an instance will not become 'running' on its own
+TERMINAL_STATUSES = ("error", "exited", "crashed")
+
+def retry_after_seconds(headers):
+    """Returns the delay requested by a Retry-After header (seconds or HTTP-date), or None"""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def rate_limit_wait(headers):
+    """Returns how long the API asked us to wait via Retry-After or X-RateLimit-* headers, or None"""
+    delay = retry_after_seconds(headers)
+    if delay is not None or not headers or headers.get("X-RateLimit-Remaining") != "0":
+        return delay
+    try:
+        reset = float(headers.get("X-RateLimit-Reset"))
+    except (TypeError, ValueError):
+        return None
+    # The reset is either an epoch timestamp or a number of seconds from now
+    return max(0.0, reset - time.time()) if reset > 1e9 else reset
+
+async def with_retry(fn, *a, retries=3, statuses=RETRY_STATUSES, **kw):
+    """Awaits fn(*a, **kw), retrying responses with one of `statuses` up to `retries` times"""
+    for attempt in range(retries + 1):
+        try:
+            return await fn(*a, **kw)
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status not in statuses or attempt == retries:
+                raise
+            delay = rate_limit_wait(e.response.headers)
+            if delay is None:
+                delay = 0.5 * 2 ** attempt
+            delay = min(MAX_RETRY_WAIT, delay) + random.uniform(0, 1)
+            print(f"   API busy (HTTP {status}). Retrying in {delay:.1f} seconds...")
+            await asleep(delay * 1000)
+
+# Async counterparts of vast.py's http_get/http_put/http_del. They go through a
+# shared httpx.AsyncClient, so the search, the create and every status poll
+# reuse one pooled connection (multiplexed when HTTP/2 is available) instead of
+# each handshaking with the API.
+async def ahttp_get(client, url, headers):
+    r = await client.get(url, headers=headers)
+    r.raise_for_status()
+    return orjson.loads(r.content)
 
-    # Add attributes from instance_config to MockArgs for create__instance
-    def __getattr__(self, name):
-        if name in config["instance_config"]:
-            return config["instance_config"][name]
-        raise AttributeError(f"'MockArgs' object has no attribute '{name}'")
-
-
-# Sleep function for waiting periods
-def sleep(ms):
-    time.sleep(ms / 1000.0)
+async def ahttp_put(client, url, headers, content=None):
+    r = await client.put(url, headers=headers, content=content)
+    r.raise_for_status()
+    return orjson.loads(r.content)
 
-def create_instance(args, offer_id):
-    """Mimics the create__instance function from vast.py"""
+async def ahttp_del(client, url, headers):
+    r = await client.delete(url, headers=headers)
+    r.raise_for_status()
+    return orjson.loads(r.content)
+
+# Recent search results keyed on (url, headers, time bucket), most recently used last
+_search_cache = OrderedDict()
+
+async def search_offers(client, args, criteria, headers):
+    """Searches offers, reusing a result fetched within the last SEARCH_CACHE_TTL seconds
+
+    The returned dict is shared with the cache; treat it as read-only.
+    """
+    url = apiurl(args, "/bundles", criteria)
+    key = (url, frozenset(headers.items()), int(time.time() // SEARCH_CACHE_TTL))
+    if key in _search_cache:
+        _search_cache.move_to_end(key)
+        return _search_cache[key]
+
+    # Errors raise here, so only successful responses are cached
+    result = await with_retry(ahttp_get, client, url, headers=headers, retries=args.retry)
+    _search_cache[key] = result
+    if len(_search_cache) > SEARCH_CACHE_SIZE:
+        _search_cache.popitem(last=False)
+    return result
+
+def select_offer(offers, selection):
+    """Returns the first offer within budget and reliability, or None"""
+    # Offers can carry nulls: no price never qualifies, no reliability counts as 0
+    return next((
+        offer for offer in offers
+        if offer.get('dph_total') is not None
+        and offer['dph_total'] <= selection["max_dph_total"]
+        and (offer.get('reliability2') or 0) >= selection["min_reliability"]
+    ), None)
+
+def instance_template(args):
+    """Builds the create__instance payload shared by every offer (everything but machine_id)"""
     runtype = None # Simplified, vast.py has logic to determine runtype
 
-    json_blob ={
+    return {
         "client_id": "me",
         "image": args.image,
         "env" : args.env, # parse_env is called inside vast.py's create__instance
@@ -98,43 +241,101 @@ def create_instance(args, offer_id):
         "user": args.user
     }
 
+async def create_instance(client, args, offer_id, headers, template=None):
+    """Mimics the create__instance function from vast.py"""
+    if template is None:
+        template = instance_template(args)
+
     # Add machine_id to the payload
-    json_blob["machine_id"] = offer_id
+    json_blob = {**template, "machine_id": offer_id}
 
     url = apiurl(args, "/asks/{id}/".format(id=offer_id))
 
-    print(f"Creating instance with payload: {json.dumps(json_blob, indent=2)}")
-
-    r = http_put(args, url,  headers=apiheaders(args), json=json_blob)
-    r.raise_for_status()
-    return r.json()
-
-
-def get_instance(args, instance_id):
-    """Mimics getting instance details"""
-    url = apiurl(args, "/instances/{id}".format(id=instance_id))
-    r = http_get(args, url, headers=apiheaders(args))
-    r.raise_for_status()
-    return r.json()
-
-def stop_instance(args, instance_id):
-    """Mimics stopping an instance"""
-    url = apiurl(args, "/instances/{id}/stop".format(id=instance_id))
-    r = http_put(args, url, headers=apiheaders(args))
-    r.raise_for_status()
-    return r.json()
-
-def delete_instance(args, instance_id):
-    """Mimics deleting an instance"""
-    url = apiurl(args, "/instances/{id}".format(id=instance_id))
-    r = http_del(args, url, headers=apiheaders(args))
-    r.raise_for_status()
-    return r.json()
+    print(f"Creating instance with payload: {orjson.dumps(json_blob, option=orjson.OPT_INDENT_2).decode()}")
 
+    # Serialize the payload once and send it as-is
+    body = orjson.dumps(json_blob)
+    try:
+        return await with_retry(ahttp_put, client, url, headers={**headers, "Content-Type": "application/json"}, content=body, retries=args.retry, statuses=CREATE_RETRY_STATUSES)
+    finally:
+        # Cached searches still list this offer, whether we just took it or the
+        # create failed because someone else had
+        _search_cache.clear()
+
+async def create_instances(client, args, offer_ids, headers, limit=MAX_CONCURRENT_REQUESTS):
+    """Creates an instance on each offer concurrently, at most `limit` requests at a time
+
+    Returns one entry per offer, in order: the create response, or the exception
+    that create raised. A failure never hides the offers that were rented, so the
+    caller still gets every new_contract ID it has to clean up.
+    """
+    # There is no batch endpoint for /asks, so the creations share one payload
+    # template and are issued side by side over the pooled client.
+    template = instance_template(args)
+    sem = asyncio.Semaphore(limit)
+
+    async def create(offer_id):
+        async with sem:
+            return await create_instance(client, args, offer_id, headers, template)
+
+    return await asyncio.gather(*(create(offer_id) for offer_id in offer_ids), return_exceptions=True)
+
+
+async def get_instance(client, args, instance_id, headers, url=None):
+    """Mimics getting instance details; pass `url` to reuse a prebuilt instance URL"""
+    if url is None:
+        url = apiurl(args, "/instances/{id}".format(id=instance_id))
+    return await with_retry(ahttp_get, client, url, headers=headers, retries=args.retry)
+
+async def get_instances(client, args, instance_ids, headers, limit=MAX_CONCURRENT_REQUESTS):
+    """Gets details for several instances concurrently, at most `limit` requests at a time
+
+    Returns one entry per instance, in order: its details, or the exception its
+    poll raised, so one failing instance doesn't hide the others' status.
+    """
+    # The Vast API has no push channel for status changes, so overlap the polls
+    # instead: wall time is roughly the slowest response rather than their sum.
+    sem = asyncio.Semaphore(limit)
+
+    async def poll(instance_id):
+        async with sem:
+            return await get_instance(client, args, instance_id, headers)
+
+    return await asyncio.gather(*(poll(instance_id) for instance_id in instance_ids), return_exceptions=True)
+
+async def stop_instance(client, args, instance_id, headers, url=None):
+    """Mimics stopping an instance; pass `url` to reuse a prebuilt stop URL"""
+    if url is None:
+        url = apiurl(args, "/instances/{id}/stop".format(id=instance_id))
+    return await with_retry(ahttp_put, client, url, headers=headers, retries=args.retry)
+
+async def delete_instance(client, args, instance_id, headers, url=None):
+    """Mimics deleting an instance; pass `url` to reuse a prebuilt instance URL"""
+    if url is None:
+        url = apiurl(args, "/instances/{id}".format(id=instance_id))
+    return await with_retry(ahttp_del, client, url, headers=headers, retries=args.retry)
+
+
+def create_client():
+    """Creates the pooled (HTTP/2 when available) client used for all API calls"""
+    # httpx resolves DNS per new connection and drops idle ones after 5s by
+    # default, which is shorter than the gaps between status polls. Keeping
+    # the connection alive for the whole rental means one lookup (and one
+    # handshake) instead of one per poll.
+    limits = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=300)
+    # httpx raises ImportError for http2=True without h2, so only ask for it when installed
+    http2 = importlib.util.find_spec("h2") is not None
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=30.0)
+
+
+async def rent_machine(client):
+    # The client is owned by the caller, so a supervisor renting several
+    # machines in a row keeps reusing the same pooled connections.
 
-async def rent_machine():
     # Create a mock args object
     args = MockArgs(api_key=API_KEY)
+    # Auth headers don't change during the rental, so build them once
+    headers = apiheaders(args)
 
     instance_id = None
 
@@ -144,10 +345,7 @@ async def rent_machine():
 
         # STEP 1: Search for available machines matching our criteria
         print('\n1. Searching for available machines...')
-        search_url = apiurl(args, "/bundles", config["search_criteria"])
-        search_results_response = http_get(args, search_url, headers=apiheaders(args))
-        search_results_response.raise_for_status()
-        search_results = search_results_response.json()
+        search_results = await search_offers(client, args, config["search_criteria"], headers)
 
         # Extract the offers list
         offers = search_results.get('offers', [])
@@ -157,10 +355,14 @@ async def rent_machine():
 
         print(f"Found {len(offers)} machines matching criteria")
 
-        # STEP 2: Select the best machine (first in the list since we sorted by price)
-        selected_machine = offers[0]
-        machine_id = selected_machine['id']
-        price = selected_machine.get('dph_total', 'unknown')
+        # STEP 2: Select the best machine (the first within budget, since we sorted by price)
+        selection = config["offer_selection"]
+        selected_machine = select_offer(offers, selection)
+
+        if selected_machine is None:
+            raise Exception(f"No offer within ${selection['max_dph_total']}/hr with reliability >= {selection['min_reliability']}")
+
+        machine_id, price = get_offer_fields(selected_machine)
         gpu_name = selected_machine.get('gpu_name', 'Unknown GPU')
         gpu_count = selected_machine.get('num_gpus', 1)
 
@@ -172,7 +374,7 @@ async def rent_machine():
         print('\n3. Creating instance on selected machine...')
 
         # Use the create_instance helper function
-        instance_creation_result = create_instance(args, machine_id)
+        instance_creation_result = await create_instance(client, args, machine_id, headers)
         instance_id = instance_creation_result.get('new_contract')
 
         if not instance_id:
@@ -180,6 +382,10 @@ async def rent_machine():
 
         print(f"   Instance created successfully! ID: {instance_id}")
 
+        # The instance URL is fixed from here on, so build it once rather than
+        # on every poll (the cleanup below can reuse it for the delete too)
+        status_url = apiurl(args, f"/instances/{instance_id}")
+
         # STEP 4: Start the instance (create_instance often starts it, but explicitly calling start is safer)
         print('\n4. Starting the instance...')
         # The create_instance call above should handle starting, but if not, uncomment below:
@@ -190,15 +396,16 @@ async def rent_machine():
         # STEP 5: Monitor instance status
         print('\n5. Monitoring instance status...')
         is_running = False
-        attempts = 0
-        max_attempts = 20 # Increased attempts for potentially longer startup
+        # Increased attempts for potentially longer startup (e.g. uncached image pulls):
+        # with the schedule below the last check lands ~285s after creation
+        max_attempts = 24
+        delays = itertools.islice(itertools.chain(POLL_DELAYS, itertools.repeat(POLL_MAX_DELAY)), max_attempts)
 
-        while not is_running and attempts < max_attempts:
-            attempts += 1
+        for attempts, delay in enumerate(delays, start=1):
             print(f"   Checking status (attempt {attempts}/{max_attempts})...")
 
             # Get the latest instance information
-            instance_status = get_instance(args, instance_id)
+            instance_status = await get_instance(client, args, instance_id, headers, status_url)
             status = instance_status.get('actual_status', 'unknown')
             print(f"   Current status: {status}")
 
@@ -220,10 +427,15 @@ async def rent_machine():
                 print('\n   Your instance is now ready to use!')
                 print('   It will continue running and incurring charges until you stop it.')
                 print('   To stop and delete this instance, uncomment the cleanup code below.')
-            else:
-                # Wait 15 seconds before checking again
-                print('   Instance not ready yet. Waiting 15 seconds...')
-                sleep(15000)
+                break
+            elif status in TERMINAL_STATUSES:
+                print(f"   Instance reached terminal status '{status}', giving up.")
+                break
+            elif attempts < max_attempts:
+                # Follow the poll schedule, with a little jitter
+                delay += random.uniform(0, delay / 10)
+                print(f"   Instance not ready yet. Waiting {delay:.1f} seconds...")
+                await asleep(delay * 1000)
 
         if not is_running:
             print('\n   The instance failed to reach running status after multiple attempts.')
@@ -235,11 +447,11 @@ async def rent_machine():
         print('\n7. Cleaning up (stopping and deleting instance)...')
 
         # Stop the instance
-        stop_result = stop_instance(args, instance_id)
+        stop_result = await stop_instance(client, args, instance_id, headers)
         print('   Instance stopped successfully')
 
         # Delete the instance
-        delete_result = delete_instance(args, instance_id)
+        delete_result = await delete_instance(client, args, instance_id, headers, status_url)
         print('   Instance deleted successfully')
         """
 
@@ -269,7 +481,11 @@ async def rent_machine():
             """)
 
 
+async def main():
+    async with create_client() as client:
+        await rent_machine(client)
+
+
 # Run the example
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(rent_machine())
\ No newline at end of file
+    asyncio.run(main())
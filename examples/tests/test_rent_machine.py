@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# Tests for the helpers in examples/rent_machine.py
+# Run from the repository root with: python -m unittest discover -s examples/tests
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+import types
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+import httpx
+
+# rent_machine.py imports a handful of helpers from vast.py, which isn't shipped
+# with this repo; provide just enough of it for the example to import
+vast = types.ModuleType("vast")
+vast.apiurl = lambda args, subpath, query_args=None: args.server_url + "/api/v0" + subpath
+vast.apiheaders = lambda args: {"Authorization": f"Bearer {args.api_key}"}
+for name in ("VastClient", "parse_query", "display_table", "offers_fields", "offers_alias", "offers_mult", "translate_null_strings_to_blanks"):
+    setattr(vast, name, None)
+sys.modules.setdefault("vast", vast)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import rent_machine  # noqa: E402
+
+
+def mock_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class ConcurrencyTracker:
+    """Async MockTransport handler that records how many requests were in flight at once"""
+    def __init__(self, respond):
+        self.respond = respond
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return self.respond(request)
+        finally:
+            self.in_flight -= 1
+
+
+class GetInstancesTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.args = rent_machine.MockArgs(api_key="test", retry=0)
+
+    async def test_results_in_order_and_failures_isolated(self):
+        def respond(request):
+            instance_id = int(request.url.path.rstrip("/").rsplit("/", 1)[-1])
+            if instance_id == 2:
+                return httpx.Response(404, json={"error": "not found"})
+            return httpx.Response(200, json={"id": instance_id, "actual_status": "running"})
+
+        async with mock_client(ConcurrencyTracker(respond)) as client:
+            results = await rent_machine.get_instances(client, self.args, [3, 2, 1], {})
+
+        self.assertEqual(results[0], {"id": 3, "actual_status": "running"})
+        self.assertIsInstance(results[1], httpx.HTTPStatusError)
+        self.assertEqual(results[2], {"id": 1, "actual_status": "running"})
+
+    async def test_concurrency_capped(self):
+        tracker = ConcurrencyTracker(lambda request: httpx.Response(200, json={}))
+        async with mock_client(tracker) as client:
+            results = await rent_machine.get_instances(client, self.args, range(10), {}, limit=3)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(tracker.max_in_flight, 3)
+
+
+class CreateClientTest(unittest.IsolatedAsyncioTestCase):
+    async def test_works_without_h2(self):
+        with mock.patch("importlib.util.find_spec", return_value=None):
+            client = rent_machine.create_client()
+        await client.aclose()
+
+
+class RateLimitWaitTest(unittest.TestCase):
+    def test_retry_after_seconds(self):
+        self.assertEqual(rent_machine.retry_after_seconds({"Retry-After": "7"}), 7.0)
+        self.assertIsNone(rent_machine.retry_after_seconds({}))
+        self.assertIsNone(rent_machine.retry_after_seconds({"Retry-After": "soon"}))
+
+    def test_retry_after_http_date(self):
+        when = formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(rent_machine.retry_after_seconds({"Retry-After": when}), 30, delta=2)
+        past = formatdate(time.time() - 30, usegmt=True)
+        self.assertEqual(rent_machine.retry_after_seconds({"Retry-After": past}), 0.0)
+
+    def test_rate_limit_reset_seconds_and_epoch(self):
+        self.assertEqual(rent_machine.rate_limit_wait({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "12"}), 12.0)
+        epoch = str(int(time.time()) + 20)
+        self.assertAlmostEqual(rent_machine.rate_limit_wait({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": epoch}), 20, delta=2)
+
+    def test_rate_limit_reset_ignored_while_requests_remain(self):
+        self.assertIsNone(rent_machine.rate_limit_wait({"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": "12"}))
+
+    def test_retry_after_takes_precedence(self):
+        headers = {"Retry-After": "3", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "12"}
+        self.assertEqual(rent_machine.rate_limit_wait(headers), 3.0)
+
+
+class WithRetryTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.args = rent_machine.MockArgs(api_key="test", retry=3)
+        # Record retry waits instead of sleeping through them, and keep the
+        # retry/payload messages out of the test output
+        self.asleep = self.enterContext(mock.patch.object(rent_machine, "asleep", mock.AsyncMock()))
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    def sequence(self, *responses):
+        requests = []
+        responses = iter(responses)
+
+        def respond(request):
+            requests.append(request)
+            return next(responses)
+        return requests, respond
+
+    async def test_wait_capped(self):
+        requests, respond = self.sequence(
+            httpx.Response(429, headers={"Retry-After": "3600"}),
+            httpx.Response(200, json={"ok": True}),
+        )
+        async with mock_client(respond) as client:
+            result = await rent_machine.get_instance(client, self.args, 1, {})
+
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(len(requests), 2)
+        delay = self.asleep.await_args.args[0] / 1000
+        self.assertGreaterEqual(delay, rent_machine.MAX_RETRY_WAIT)
+        self.assertLessEqual(delay, rent_machine.MAX_RETRY_WAIT + 1)
+
+    async def test_gives_up_after_retries(self):
+        requests, respond = self.sequence(*[httpx.Response(503)] * 4)
+        async with mock_client(respond) as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await rent_machine.get_instance(client, self.args, 1, {})
+        self.assertEqual(len(requests), 4)
+
+    async def test_other_errors_not_retried(self):
+        requests, respond = self.sequence(httpx.Response(404))
+        async with mock_client(respond) as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await rent_machine.get_instance(client, self.args, 1, {})
+        self.assertEqual(len(requests), 1)
+
+    async def test_create_not_retried_on_gateway_error(self):
+        requests, respond = self.sequence(httpx.Response(504), httpx.Response(200, json={"new_contract": 1}))
+        async with mock_client(respond) as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await rent_machine.create_instance(client, self.args, 1, {})
+        self.assertEqual(len(requests), 1)
+
+    async def test_create_retried_when_throttled(self):
+        requests, respond = self.sequence(
+            httpx.Response(429, headers={"Retry-After": "1"}),
+            httpx.Response(200, json={"new_contract": 1}),
+        )
+        async with mock_client(respond) as client:
+            result = await rent_machine.create_instance(client, self.args, 1, {})
+        self.assertEqual(result, {"new_contract": 1})
+        self.assertEqual(len(requests), 2)
+
+
+class SearchCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.args = rent_machine.MockArgs(api_key="test", retry=0)
+        rent_machine._search_cache.clear()
+
+    async def test_failed_create_evicts_cached_search(self):
+        searches = []
+
+        def respond(request):
+            if request.url.path.endswith("/bundles"):
+                searches.append(request)
+                return httpx.Response(200, json={"offers": [{"id": 1}]})
+            return httpx.Response(400, json={"error": "offer unavailable"})
+
+        async with mock_client(respond) as client:
+            await rent_machine.search_offers(client, self.args, {}, {})
+            await rent_machine.search_offers(client, self.args, {}, {})
+            self.assertEqual(len(searches), 1)
+
+            with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(httpx.HTTPStatusError):
+                await rent_machine.create_instance(client, self.args, 1, {})
+
+            await rent_machine.search_offers(client, self.args, {}, {})
+        self.assertEqual(len(searches), 2)
+
+
+class SelectOfferTest(unittest.TestCase):
+    selection = {"max_dph_total": 1.0, "min_reliability": 0.95}
+
+    def test_skips_offers_with_null_fields(self):
+        offers = [
+            {"id": 1, "dph_total": None, "reliability2": 0.99},
+            {"id": 2, "dph_total": 0.5, "reliability2": None},
+            {"id": 3, "dph_total": 0.6, "reliability2": 0.99},
+        ]
+        self.assertEqual(rent_machine.select_offer(offers, self.selection)["id"], 3)
+
+    def test_free_offer_is_within_budget(self):
+        offers = [{"id": 1, "dph_total": 0.0, "reliability2": 0.99}]
+        self.assertEqual(rent_machine.select_offer(offers, self.selection)["id"], 1)
+
+    def test_none_when_nothing_qualifies(self):
+        offers = [{"id": 1, "dph_total": 2.0, "reliability2": 0.99}, {"id": 2, "dph_total": 0.5, "reliability2": 0.5}]
+        self.assertIsNone(rent_machine.select_offer(offers, self.selection))
+
+
+class CreateInstancesTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.args = rent_machine.MockArgs(api_key="test", retry=0)
+
+    async def create_instances(self, handler, offer_ids, **kw):
+        # create_instance prints every payload; keep the test output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            async with mock_client(handler) as client:
+                return await rent_machine.create_instances(client, self.args, offer_ids, {}, **kw)
+
+    async def test_failure_does_not_hide_created_instances(self):
+        def respond(request):
+            offer_id = int(request.url.path.rstrip("/").rsplit("/", 1)[-1])
+            if offer_id == 1:
+                return httpx.Response(400, json={"error": "offer unavailable"})
+            return httpx.Response(200, json={"success": True, "new_contract": offer_id * 100})
+
+        results = await self.create_instances(ConcurrencyTracker(respond), [1, 2, 3])
+
+        self.assertIsInstance(results[0], httpx.HTTPStatusError)
+        self.assertEqual(results[1]["new_contract"], 200)
+        self.assertEqual(results[2]["new_contract"], 300)
+
+    async def test_concurrency_capped(self):
+        tracker = ConcurrencyTracker(lambda request: httpx.Response(200, json={"new_contract": 1}))
+        results = await self.create_instances(tracker, range(8), limit=2)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(tracker.max_in_flight, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()